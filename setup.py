@@ -0,0 +1,13 @@
+from Cython.Build import cythonize
+from setuptools import setup
+
+extensions = cythonize('dedup_kernels.pyx', compiler_directives={'language_level': 3})
+# video_dedup falls back to Numba or NumPy, so a host without a C compiler still installs;
+# set after cythonize, which does not carry the flag over to the extensions it returns
+for extension in extensions:
+    extension.optional = True
+
+setup(
+    py_modules=['video_dedup'],
+    ext_modules=extensions,
+)
@@ -0,0 +1,224 @@
+import cv2
+import numpy as np
+import pytest
+
+import video_dedup
+from video_dedup import (
+    HASH_BATCH_SIZE,
+    VideoDeduplicator,
+    _find_match,
+    _find_match_numpy,
+    _hamming_distances,
+    _hash_frame,
+    _thumbnails_to_phashes_numpy,
+)
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+@pytest.fixture
+def make_dedup(tmp_path):
+    """VideoDeduplicator factory for tests that feed it hashes or frames directly."""
+    video = tmp_path / 'placeholder.mp4'
+    video.touch()
+    return lambda **kwargs: VideoDeduplicator(str(video), **kwargs)
+
+
+@pytest.fixture(scope='module')
+def clip(tmp_path_factory):
+    """Path of a short mp4v clip whose frames all differ, and its frames decoded in order."""
+    path = tmp_path_factory.mktemp('clip') / 'clip.mp4'
+    # A keyframe every 30 frames, so seeking has to decode forward from a keyframe
+    writer = cv2.VideoWriter(str(path), cv2.CAP_FFMPEG, cv2.VideoWriter_fourcc(*'mp4v'), 30, (160, 120),
+                             [cv2.VIDEOWRITER_PROP_KEY_INTERVAL, 30])
+    for frame_num in range(120):
+        frame = np.full((120, 160, 3), 255, dtype=np.uint8)
+        cv2.rectangle(frame, (frame_num, 20), (frame_num + 30, 60), (0, 0, 0), -1)
+        cv2.putText(frame, str(frame_num), (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+        writer.write(frame)
+    writer.release()
+
+    cap = cv2.VideoCapture(str(path))
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return path, frames
+
+
+def _flip_bits(frame_hash, rng, count):
+    flipped = frame_hash.copy()
+    for bit in rng.choice(64 * len(flipped), count, replace=False):
+        flipped[bit // 64] ^= np.uint64(1) << np.uint64(bit % 64)
+    return flipped
+
+
+def test_compiled_phash_matches_numpy(rng):
+    dedup_kernels = pytest.importorskip('dedup_kernels')
+    thumbnails = [rng.integers(0, 256, (32, 32), dtype=np.uint8) for _ in range(200)]
+    # A horizontal gradient has only first-row AC energy, so most terms tie at zero
+    thumbnails += [np.full((32, 32), 128, dtype=np.uint8) + np.arange(32, dtype=np.uint8)]
+    # Uniform thumbnails have no AC energy at all, only rounding noise
+    thumbnails += [np.full((32, 32), value, dtype=np.uint8) for value in (0, 1, 5, 128, 254, 255)]
+
+    expected = _thumbnails_to_phashes_numpy(thumbnails)[:, 0]
+    actual = np.array([dedup_kernels.phash64(thumbnail) for thumbnail in thumbnails], dtype=np.uint64)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_phash_keeps_float_median_order(rng):
+    thumbnails = [rng.integers(0, 256, (32, 32), dtype=np.uint8) for _ in range(200)]
+
+    low = np.stack([cv2.dct(thumbnail.astype(np.float32))[:8, :8] for thumbnail in thumbnails])
+    low = low.reshape(len(thumbnails), 64)
+    med = np.median(low[:, 1:], axis=1)
+    expected = np.packbits(low > med[:, None], axis=1).view('>u8')[:, 0]
+    np.testing.assert_array_equal(_thumbnails_to_phashes_numpy(thumbnails)[:, 0], expected)
+
+
+@pytest.mark.parametrize('words, threshold', [(1, 5), (4, 31)])
+@pytest.mark.parametrize('count', [1, 100, 5000])
+def test_find_match_matches_numpy(rng, words, threshold, count):
+    accepted = rng.integers(0, 2**63, (count, words), dtype=np.uint64)
+    candidates = [rng.integers(0, 2**63, words, dtype=np.uint64)]
+    # Near copies of rows spread across the index, flipping up to threshold + 1 bits
+    for row in rng.integers(0, count, 10):
+        candidates.append(_flip_bits(accepted[row], rng, rng.integers(0, threshold + 2)))
+
+    for candidate in candidates:
+        assert _find_match(accepted, candidate, threshold) == _find_match_numpy(accepted, candidate, threshold)
+
+
+
+@pytest.mark.parametrize('algo', ['phash', 'pdq'])
+@pytest.mark.parametrize('index', ['linear', 'bktree'])
+def test_find_unique_frames_matches_brute_force(make_dedup, rng, algo, index):
+    if algo == 'pdq' and video_dedup.pdqhash is None:
+        pytest.skip('pdqhash is not installed')
+    if index == 'bktree' and video_dedup.pybktree is None:
+        pytest.skip('pybktree is not installed')
+
+    dedup = make_dedup(algo=algo, index=index)
+    words = dedup.hash_bits // 64
+
+    # Runs of noisy copies of a few scenes, revisited out of order, so both the
+    # previous-scene check and the index lookup decide some frames
+    scenes = rng.integers(0, 2**63, (20, words), dtype=np.uint64)
+    frame_hashes = []
+    for scene in rng.integers(0, len(scenes), 60):
+        for _ in range(rng.integers(1, 8)):
+            frame_hash = _flip_bits(scenes[scene], rng, rng.integers(0, 2 * dedup.similarity_threshold))
+            frame_hashes.append((len(frame_hashes), frame_hash))
+
+    expected = []
+    kept = []
+    for frame_num, frame_hash in frame_hashes:
+        if not kept or _hamming_distances(np.array(kept), frame_hash).min() > dedup.similarity_threshold:
+            expected.append(frame_num)
+            kept.append(frame_hash)
+
+    unique_frames, total_frames = dedup.find_unique_frames(iter(frame_hashes))
+    assert unique_frames == expected
+    assert total_frames == len(frame_hashes)
+
+
+def _frames_with_repeats(rng, repeated):
+    """Random 64x64 frames where each frame in repeated is a byte-identical copy of the one before."""
+    frames = []
+    for frame_num in range(2 * HASH_BATCH_SIZE + 10):
+        if frame_num in repeated:
+            frames.append(frames[-1].copy())
+        else:
+            frames.append(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8))
+    return frames
+
+
+@pytest.mark.parametrize('algo', ['phash', 'pdq'])
+def test_repeated_frames_reuse_hashes_across_batches(make_dedup, rng, monkeypatch, caplog, algo):
+    if algo == 'pdq' and video_dedup.pdqhash is None:
+        pytest.skip('pdqhash is not installed')
+
+    # One run spans a batch boundary and one starts a batch, so a batch opens on a reused hash
+    repeated = set(range(HASH_BATCH_SIZE - 3, HASH_BATCH_SIZE + 3)) | {2 * HASH_BATCH_SIZE, 2 * HASH_BATCH_SIZE + 1}
+    frames = _frames_with_repeats(rng, repeated)
+    dedup = make_dedup(algo=algo)
+    monkeypatch.setattr(dedup, 'extract_frames', lambda interval=None: iter(enumerate(frames)))
+
+    with caplog.at_level('INFO'):
+        frame_hashes = list(dedup._hash_frames_cpu())
+
+    assert [frame_num for frame_num, _ in frame_hashes] == list(range(len(frames)))
+    for (frame_num, frame_hash), frame in zip(frame_hashes, frames):
+        np.testing.assert_array_equal(frame_hash, _hash_frame(algo, frame), err_msg=f"frame {frame_num}")
+    assert f"Reused hashes for {len(repeated)} byte-identical frames" in caplog.text
+
+
+def test_pool_preserves_order_and_handles_resized_frames(make_dedup, rng, monkeypatch):
+    frames = [rng.integers(0, 256, (64, 64, 3), dtype=np.uint8) for _ in range(40)]
+    # A repeat shares the previous frame's result, and frames of another shape bypass the ring
+    frames[10] = frames[9].copy()
+    frames[20] = rng.integers(0, 256, (48, 80, 3), dtype=np.uint8)
+    frames[21] = frames[20].copy()
+    dedup = make_dedup(workers=2)
+    monkeypatch.setattr(dedup, 'extract_frames', lambda interval=None: iter(enumerate(frames)))
+
+    frame_hashes = list(dedup._hash_frames_pool())
+
+    assert [frame_num for frame_num, _ in frame_hashes] == list(range(len(frames)))
+    for (frame_num, frame_hash), frame in zip(frame_hashes, frames):
+        np.testing.assert_array_equal(frame_hash, _hash_frame('phash', frame), err_msg=f"frame {frame_num}")
+
+
+@pytest.mark.parametrize('seek', [True, False, None], ids=['seek', 'grab', 'adaptive'])
+@pytest.mark.parametrize('interval', [None, 1, 3, 10, 45])
+def test_extract_frames_matches_sequential_decode(clip, seek, interval):
+    path, decoded = clip
+    dedup = VideoDeduplicator(str(path))
+    if seek is not None:
+        dedup._seek_choice[interval] = seek
+
+    frames = list(dedup.extract_frames(interval))
+
+    assert [frame_num for frame_num, _ in frames] == list(range(0, len(decoded), interval or 1))
+    for frame_num, frame in frames:
+        np.testing.assert_array_equal(frame, decoded[frame_num], err_msg=f"frame {frame_num}")
+    if seek is None and interval in (3, 10):
+        # Enough gaps were sampled to settle on a strategy, which the save pass then reuses
+        assert interval in dedup._seek_choice
+
+
+@pytest.mark.parametrize('interval, unique_frames', [
+    (None, [57, 0, 12, 13, 119]),
+    (3, [9, 0, 60]),
+    (None, []),
+])
+def test_save_unique_frames_writes_each_frame_once(clip, tmp_path, monkeypatch, interval, unique_frames):
+    path, decoded = clip
+    dedup = VideoDeduplicator(str(path))
+    decoded_count = 0
+    extract_frames = dedup.extract_frames
+
+    def counting_extract_frames(interval=None):
+        nonlocal decoded_count
+        for frame_num, frame in extract_frames(interval):
+            decoded_count += 1
+            yield frame_num, frame
+
+    monkeypatch.setattr(dedup, 'extract_frames', counting_extract_frames)
+    output_dir = tmp_path / 'unique'
+    dedup.save_unique_frames(unique_frames, str(output_dir), interval)
+
+    written = sorted(output_dir.iterdir())
+    assert [p.name for p in written] == [f"unique_frame_{n:06d}.jpg" for n in sorted(unique_frames)]
+    for frame_num, image_path in zip(sorted(unique_frames), written):
+        image = cv2.imread(str(image_path)).astype(np.int16)
+        # JPEG is lossy, so check the image is closest to its own decoded frame
+        assert np.argmin([np.abs(image - frame).mean() for frame in decoded]) == frame_num
+    # Decoding stops at the last unique frame
+    assert decoded_count == (max(unique_frames) // (interval or 1) + 1 if unique_frames else 0)
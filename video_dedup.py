@@ -5,173 +5,650 @@ Extracts frames from video files and removes duplicates using perceptual hashing
 """
 
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
 import cv2
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
 import os
 import sys
+import time
+import zlib
 from pathlib import Path
-import imagehash
-from PIL import Image
-import tempfile
-import shutil
-from typing import List, Tuple, Dict
+from typing import Iterable, Iterator, List, Optional, Tuple
 import logging
 
+try:
+    import dedup_kernels
+except ImportError:
+    dedup_kernels = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:
+    import pybktree
+except ImportError:
+    pybktree = None
+
+try:
+    import pdqhash
+except ImportError:
+    pdqhash = None
+
+try:
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
+
+try:
+    from scipy import fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
+# Hash width in bits and default similarity threshold for each algorithm
+HASH_ALGORITHMS = {
+    'phash': (64, 5),
+    'pdq': (256, 31),
+}
+
+
+# Frames reduced to thumbnails before their hashes are computed in one batch
+HASH_BATCH_SIZE = 128
+
+# Sampled gaps timed with each of seeking and grabbing before the faster is kept
+SEEK_PROBE_SAMPLES = 4
+
+# Kept hash words from which Numba's vectorised, parallel scan beats the serial compiled one
+PARALLEL_SCAN_MIN_WORDS = 2048
+
+# Frames decoded and downscaled on the GPU before one host synchronisation
+GPU_BATCH_SIZE = 32
+
+# Structures that can hold the kept hashes; the compiled linear scan is the default
+HASH_INDEXES = ('linear', 'bktree')
+
+
+def _cuda_available() -> bool:
+    """Whether this OpenCV build can decode video and run kernels on a CUDA device."""
+    try:
+        return hasattr(cv2, 'cudacodec') and cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except cv2.error:
+        return False
+
+
+def _frame_checksum(frame: np.ndarray) -> int:
+    """CRC of the raw pixel bytes, used to skip hashing byte-identical frames."""
+    data = frame.reshape(-1)
+    if google_crc32c is None:
+        return zlib.crc32(data)
+    # google_crc32c only accepts read-only buffers; uses SSE4.2 CRC32 where available
+    data.flags.writeable = False
+    return google_crc32c.value(data)
+
+
+def _frame_to_thumbnail(frame_bgr: np.ndarray) -> np.ndarray:
+    """Reduce a decoded BGR frame to the 32x32 grayscale thumbnail pHash works on."""
+    gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA)
+
+
+def _low_frequency_dct(thumbnails: np.ndarray) -> np.ndarray:
+    """Top-left 8x8 block of the orthonormal 2D DCT-II of each thumbnail in a stack."""
+    stack = thumbnails.astype(np.float64)
+    if scipy_fft is not None and len(stack) > 1:
+        return scipy_fft.dctn(stack, axes=(1, 2), norm='ortho', workers=-1)[:, :8, :8]
+    return np.stack([cv2.dct(thumbnail)[:8, :8] for thumbnail in stack])
+
+
+def _thumbnails_to_phashes_numpy(thumbnails: List[np.ndarray]) -> np.ndarray:
+    """Compute the 64-bit pHashes of a batch of 32x32 grayscale thumbnails as (B, 1) uint64."""
+    low = _low_frequency_dct(np.stack(thumbnails)).reshape(len(thumbnails), 64)
+    # Fixed point at 2**-20 keeps the float ordering of the coefficients but snaps rounding
+    # noise, such as the AC terms of a flat frame, to exact values every DCT agrees on
+    q = np.rint(low * 2.0 ** 20).astype(np.int64)
+    # Median of the 63 AC terms is one of them, so it is exact
+    med = np.median(q[:, 1:], axis=1).astype(np.int64)
+    return np.packbits(q > med[:, None], axis=1).view('>u8').astype(np.uint64)
+
+
+if dedup_kernels is not None:
+    # The compiled kernel is bit-identical and at least as fast per thumbnail as a batched DCT
+    def _thumbnails_to_phashes(thumbnails: List[np.ndarray]) -> np.ndarray:
+        """Compute the 64-bit pHashes of a batch of 32x32 grayscale thumbnails as (B, 1) uint64."""
+        return np.array([[dedup_kernels.phash64(thumbnail)] for thumbnail in thumbnails], dtype=np.uint64)
+else:
+    _thumbnails_to_phashes = _thumbnails_to_phashes_numpy
+
+
+def phash64(gray: np.ndarray) -> np.uint64:
+    """Compute the 64-bit pHash of a grayscale uint8 image."""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA)
+    return _thumbnails_to_phashes([small])[0, 0]
+
+
+def _frame_to_pdq(frame_bgr: np.ndarray) -> np.ndarray:
+    """Compute the 256-bit PDQ hash of a decoded BGR frame as four uint64 words."""
+    rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+    hash_vector, _quality = pdqhash.compute(rgb)
+    return np.packbits(hash_vector.astype(np.uint8)).view('>u8').astype(np.uint64)
+
+
+# Per-frame reduction and batched hash for each algorithm; PDQ does all its work per frame
+_HASH_STAGES = {
+    'phash': (_frame_to_thumbnail, _thumbnails_to_phashes),
+    'pdq': (_frame_to_pdq, np.stack),
+}
+
+
+def _hash_frame(algo: str, frame_bgr: np.ndarray) -> np.ndarray:
+    """Hash a single decoded BGR frame as a batch of one."""
+    reduce_frame, hash_batch = _HASH_STAGES[algo]
+    return hash_batch([reduce_frame(frame_bgr)])[0]
+
+
+# Worker-side view of the parent's shared frame ring, set by _attach_frame_ring
+_frame_ring_shm = None
+_frame_ring = None
+
+
+def _attach_frame_ring(name: str, shape: Tuple[int, ...], dtype: str):
+    """Process pool initializer mapping the shared frame ring into this worker."""
+    global _frame_ring_shm, _frame_ring
+    _frame_ring_shm = shared_memory.SharedMemory(name=name)
+    _frame_ring = np.ndarray(shape, dtype=dtype, buffer=_frame_ring_shm.buf)
+
+
+def _hash_ring_slot(algo: str, slot: int) -> np.ndarray:
+    """Hash the frame the parent wrote into the given ring slot."""
+    return _hash_frame(algo, _frame_ring[slot])
+
+
+def _hamming(a: int, b: int) -> int:
+    """Hamming distance between two integer hashes."""
+    return (a ^ b).bit_count()
+
+
+def _words_to_hash(words: np.ndarray) -> int:
+    """Join big-endian uint64 hash words into a single integer."""
+    if len(words) == 1:
+        return int(words[0])
+    return int.from_bytes(words.astype('>u8').tobytes(), 'big')
+
+
+def _hamming_distances(accepted: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    """Hamming distances from one hash to every row of an (N, words) uint64 array."""
+    xor = np.bitwise_xor(accepted, candidate)
+    if hasattr(np, 'bitwise_count'):
+        bits = np.bitwise_count(xor)
+    else:
+        bits = np.unpackbits(xor.view(np.uint8), axis=1)
+    return bits.sum(axis=1, dtype=np.int64)
+
+
+def _find_match_numpy(accepted: np.ndarray, candidate: np.ndarray, threshold: int) -> int:
+    """Index of the first accepted hash within threshold of candidate, or -1."""
+    matches = np.flatnonzero(_hamming_distances(accepted, candidate) <= threshold)
+    return int(matches[0]) if matches.size else -1
+
+
+if njit is not None:
+    # Hashes scanned per parallel task; each task stops at its first match
+    _MATCH_BLOCK = 4096
+
+    @njit(inline='always')
+    def _popcount64(x):
+        # SWAR popcount, LLVM folds this pattern into a single ctpop
+        x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+        x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+        x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+        return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+    # Compiled on first use, so runs that never scan a large index pay no JIT cost
+    @njit(parallel=True, cache=True)
+    def _find_match_numba(accepted, candidate, threshold):
+        n, words = accepted.shape
+        blocks = (n + _MATCH_BLOCK - 1) // _MATCH_BLOCK
+        found = np.full(blocks, -1, dtype=np.int64)
+        
+        for block in prange(blocks):
+            stop = min(n, (block + 1) * _MATCH_BLOCK)
+            for i in range(block * _MATCH_BLOCK, stop):
+                distance = np.uint64(0)
+                for w in range(words):
+                    distance += _popcount64(accepted[i, w] ^ candidate[w])
+                if distance <= threshold:
+                    found[block] = i
+                    break
+        
+        for block in range(blocks):
+            if found[block] >= 0:
+                return found[block]
+        return -1
+
+if dedup_kernels is not None and njit is not None:
+    def _find_match(accepted: np.ndarray, candidate: np.ndarray, threshold: int) -> int:
+        """Index of the first accepted hash within threshold of candidate, or -1."""
+        if accepted.size < PARALLEL_SCAN_MIN_WORDS:
+            return dedup_kernels.find_match(accepted, candidate, threshold)
+        return int(_find_match_numba(accepted, candidate, np.uint64(threshold)))
+elif dedup_kernels is not None:
+    def _find_match(accepted: np.ndarray, candidate: np.ndarray, threshold: int) -> int:
+        """Index of the first accepted hash within threshold of candidate, or -1."""
+        return dedup_kernels.find_match(accepted, candidate, threshold)
+elif njit is not None:
+    def _find_match(accepted: np.ndarray, candidate: np.ndarray, threshold: int) -> int:
+        """Index of the first accepted hash within threshold of candidate, or -1."""
+        return int(_find_match_numba(accepted, candidate, np.uint64(threshold)))
+else:
+    _find_match = _find_match_numpy
+
+
+class _LinearHashIndex:
+    """Accepted hashes in a contiguous (N, words) uint64 buffer, scanned in full per query."""
+
+    def __init__(self, hash_bits: int):
+        self.words = hash_bits // 64
+        self.hashes = np.empty((1024, self.words), dtype=np.uint64)
+        self.frames = []
+
+    def find(self, frame_hash: np.ndarray, threshold: int) -> Optional[Tuple[int, int, int]]:
+        """Return (frame_num, distance, hash) of an accepted hash within threshold."""
+        count = len(self.frames)
+        if not count:
+            return None
+        
+        match = _find_match(self.hashes[:count], frame_hash, threshold)
+        if match < 0:
+            return None
+        matched = _words_to_hash(self.hashes[match])
+        return self.frames[match], _hamming(matched, _words_to_hash(frame_hash)), matched
+
+    def add(self, frame_num: int, frame_hash: np.ndarray):
+        count = len(self.frames)
+        if count == len(self.hashes):
+            self.hashes = np.resize(self.hashes, (2 * count, self.words))
+        self.hashes[count] = frame_hash
+        self.frames.append(frame_num)
+
+
+class _BKTreeHashIndex:
+    """Accepted hashes in a BK-tree, pruned by the triangle inequality per query."""
+
+    def __init__(self):
+        self.tree = pybktree.BKTree(lambda a, b: _hamming(a[0], b[0]))
+
+    def find(self, frame_hash: np.ndarray, threshold: int) -> Optional[Tuple[int, int, int]]:
+        """Return (frame_num, distance, hash) of an accepted hash within threshold."""
+        matches = self.tree.find((_words_to_hash(frame_hash), None), threshold)
+        if not matches:
+            return None
+        difference, (matched, frame_num) = matches[0]
+        return frame_num, difference, matched
+
+    def add(self, frame_num: int, frame_hash: np.ndarray):
+        self.tree.add((_words_to_hash(frame_hash), frame_num))
+
 
 class VideoDeduplicator:
-    def __init__(self, video_path: str, similarity_threshold: int = 5):
+    def __init__(self, video_path: str, similarity_threshold: int = None, algo: str = 'phash',
+                 use_gpu: bool = False, workers: int = 1, index: str = 'linear'):
+        if algo not in HASH_ALGORITHMS:
+            raise ValueError(f"Unknown hash algorithm: {algo}")
+        if algo == 'pdq' and pdqhash is None:
+            raise ImportError("PDQ hashing requires the pdqhash package")
+        if index not in HASH_INDEXES:
+            raise ValueError(f"Unknown hash index: {index}")
+        if index == 'bktree' and pybktree is None:
+            raise ImportError("The BK-tree index requires the pybktree package")
+        if use_gpu and algo != 'phash':
+            raise ValueError("GPU hashing is only supported with phash")
+        
         self.video_path = Path(video_path)
-        self.similarity_threshold = similarity_threshold
+        self.algo = algo
+        self.hash_bits, default_threshold = HASH_ALGORITHMS[algo]
+        self.similarity_threshold = default_threshold if similarity_threshold is None else similarity_threshold
+        self.workers = workers
+        self.index = index
+        # Whether seeking beat grabbing for each interval, measured by extract_frames
+        self._seek_choice = {}
         self.supported_formats = {'.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.m4v'}
         
+        self.use_gpu = use_gpu and _cuda_available()
+        if use_gpu and not self.use_gpu:
+            logger.warning("OpenCV was built without CUDA video decoding, falling back to CPU")
+        
         if not self.video_path.exists():
             raise FileNotFoundError(f"Video file not found: {video_path}")
         
         if self.video_path.suffix.lower() not in self.supported_formats:
             logger.warning(f"Format {self.video_path.suffix} may not be supported")
 
-    def extract_frames(self, interval: int = None) -> List[Tuple[int, str]]:
-        """Extract frames from video. If interval is None, extract all frames."""
+    def _open_capture(self) -> cv2.VideoCapture:
         cap = cv2.VideoCapture(str(self.video_path))
         
         if not cap.isOpened():
             raise ValueError(f"Cannot open video file: {self.video_path}")
         
-        temp_dir = tempfile.mkdtemp()
-        frames = []
-        frame_count = 0
-        extracted_count = 0
-        
+        return cap
+
+    def video_info(self) -> Tuple[int, float]:
+        """Return the frame count and FPS reported by the container."""
+        cap = self._open_capture()
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+        return total_frames, fps
+
+    def extract_frames(self, interval: int = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """Decode frames from video. If interval is None, yield all frames.
         
-        logger.info(f"Video info: {total_frames} frames, {fps:.2f} FPS")
+        Skipped frames are either grabbed and discarded without conversion or
+        jumped over by seeking. Seeking restarts decoding at the previous
+        keyframe, so it only pays off when the interval is large relative to
+        the GOP; the first sampled gaps alternate between both and the faster
+        one is kept for the rest of the video.
+        """
+        cap = self._open_capture()
+        # Next frame the decoder returns, and next frame to yield
+        position = 0
+        frame_count = 0
         
-        if interval:
-            logger.info(f"Extracting frames at {interval} frame intervals")
-        else:
-            logger.info("Extracting all frames")
+        seek = self._seek_choice.get(interval) if interval and interval > 1 else False
+        timings = {False: [], True: []}
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
+        try:
+            while True:
+                use_seek = seek if seek is not None else len(timings[False]) > len(timings[True])
+                start = time.perf_counter()
+                
+                if use_seek and position < frame_count:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
+                else:
+                    while position < frame_count and cap.grab():
+                        position += 1
+                    if position < frame_count:
+                        break
+                
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                position = frame_count + 1
+                
+                if seek is None and frame_count:
+                    timings[use_seek].append(time.perf_counter() - start)
+                    if len(timings[True]) == SEEK_PROBE_SAMPLES:
+                        seek = sum(timings[True]) < sum(timings[False])
+                        self._seek_choice[interval] = seek
+                        logger.debug(f"{'Seeking' if seek else 'Grabbing'} between sampled frames")
+                
+                yield frame_count, frame
+                frame_count += interval or 1
+        finally:
+            cap.release()
+
+    def _hash_frames_cpu(self, interval: int = None) -> Iterator[Tuple[int, np.ndarray]]:
+        reduce_frame, hash_batch = _HASH_STAGES[self.algo]
+        # (frame_num, reduced frame), or None in place of a repeat of the previous frame
+        batch = []
+        last_checksum = None
+        last_hash = None
+        repeated = 0
+        
+        def flush_batch():
+            nonlocal last_hash
+            reduced = [item for _, item in batch if item is not None]
+            hashes = iter(hash_batch(reduced) if reduced else [])
+            for frame_num, item in batch:
+                if item is not None:
+                    last_hash = next(hashes)
+                yield frame_num, last_hash
+            batch.clear()
+        
+        for frame_num, frame in self.extract_frames(interval):
+            checksum = _frame_checksum(frame)
             
-            should_extract = interval is None or frame_count % interval == 0
+            if checksum == last_checksum:
+                repeated += 1
+                batch.append((frame_num, None))
+            else:
+                try:
+                    batch.append((frame_num, reduce_frame(frame)))
+                    last_checksum = checksum
+                except Exception as e:
+                    last_checksum = None
+                    logger.warning(f"Failed to process frame {frame_num}: {e}")
             
-            if should_extract:
-                frame_path = os.path.join(temp_dir, f"frame_{frame_count:06d}.jpg")
-                cv2.imwrite(frame_path, frame)
-                frames.append((frame_count, frame_path))
-                extracted_count += 1
+            if len(batch) == HASH_BATCH_SIZE:
+                yield from flush_batch()
+        
+        yield from flush_batch()
+        logger.info(f"Reused hashes for {repeated} byte-identical frames")
+
+    def _hash_frames_pool(self, interval: int = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """Hash frames in worker processes, passing pixels through a shared memory ring."""
+        frames = self.extract_frames(interval)
+        first = next(frames, None)
+        if first is None:
+            return
+        frames = itertools.chain([first], frames)
+        
+        # Enough slots for every frame allowed in flight plus the one being decoded
+        ring_size = 2 * self.workers + 2
+        frame_shape, frame_dtype = first[1].shape, first[1].dtype
+        shm = shared_memory.SharedMemory(create=True, size=ring_size * first[1].nbytes)
+        ring = np.ndarray((ring_size,) + frame_shape, dtype=frame_dtype, buffer=shm.buf)
+        slot_futures = [None] * ring_size
+        next_slot = 0
+        
+        pending = deque()
+        last_checksum = None
+        last_future = None
+        repeated = 0
+        
+        # Forked workers inherit OpenCV's and Numba's thread pools and can deadlock
+        context = multiprocessing.get_context('spawn')
+        
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                     initializer=_attach_frame_ring,
+                                     initargs=(shm.name, ring.shape, frame_dtype.str)) as executor:
+                for frame_num, frame in frames:
+                    checksum = _frame_checksum(frame)
+                    
+                    # A byte-identical frame shares the previous frame's pending result
+                    if checksum == last_checksum:
+                        repeated += 1
+                    elif frame.shape != frame_shape:
+                        last_checksum = checksum
+                        last_future = executor.submit(_hash_frame, self.algo, frame)
+                    else:
+                        # Wait until the worker reading this slot last time is done with it
+                        slot = next_slot
+                        if slot_futures[slot] is not None:
+                            wait([slot_futures[slot]])
+                        ring[slot] = frame
+                        
+                        last_checksum = checksum
+                        last_future = executor.submit(_hash_ring_slot, self.algo, slot)
+                        slot_futures[slot] = last_future
+                        next_slot = (slot + 1) % ring_size
+                    pending.append((frame_num, last_future))
+                    
+                    # Results come back in submission order so frame order is preserved
+                    while len(pending) > 2 * self.workers or (pending and pending[0][1].done()):
+                        frame_num, future = pending.popleft()
+                        try:
+                            yield frame_num, future.result()
+                        except Exception as e:
+                            logger.warning(f"Failed to process frame {frame_num}: {e}")
                 
-                if extracted_count % 100 == 0:
-                    logger.info(f"Extracted {extracted_count} frames...")
+                for frame_num, future in pending:
+                    try:
+                        yield frame_num, future.result()
+                    except Exception as e:
+                        logger.warning(f"Failed to process frame {frame_num}: {e}")
+        finally:
+            del ring
+            shm.close()
+            shm.unlink()
+        
+        logger.info(f"Reused hashes for {repeated} byte-identical frames")
+
+    def _hash_frames_gpu(self, interval: int = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """Decode with NVDEC and downscale on the GPU, copying back only 32x32 thumbnails."""
+        reader = cv2.cudacodec.createVideoReader(str(self.video_path))
+        stream = cv2.cuda_Stream()
+        # Reused device buffers, one grayscale frame and thumbnail per batch slot
+        gray_pool = [cv2.cuda_GpuMat() for _ in range(GPU_BATCH_SIZE)]
+        small_pool = [cv2.cuda_GpuMat() for _ in range(GPU_BATCH_SIZE)]
+        batch = []
+        frame_count = 0
+        
+        while True:
+            ret, frame = reader.nextFrame(stream=stream)
+            
+            if ret and (interval is None or frame_count % interval == 0):
+                slot = len(batch)
+                cv2.cuda.cvtColor(frame, cv2.COLOR_BGRA2GRAY, gray_pool[slot], stream=stream)
+                cv2.cuda.resize(gray_pool[slot], (32, 32), small_pool[slot],
+                                interpolation=cv2.INTER_AREA, stream=stream)
+                batch.append(frame_count)
             
+            if batch and (not ret or len(batch) == GPU_BATCH_SIZE):
+                # cv2.cuda has no DCT, so the tiny thumbnails are hashed on the host
+                stream.waitForCompletion()
+                thumbnails = [small_pool[slot].download() for slot in range(len(batch))]
+                yield from zip(batch, _thumbnails_to_phashes(thumbnails))
+                batch = []
+            
+            if not ret:
+                break
             frame_count += 1
-        
-        cap.release()
-        logger.info(f"Extracted {extracted_count} frames total")
-        return frames
 
-    def generate_hashes(self, frames: List[Tuple[int, str]]) -> Dict[int, str]:
-        """Generate perceptual hashes for frames."""
-        hashes = {}
+    def iter_hashes(self, interval: int = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield (frame_num, hash) pairs as frames are decoded, without keeping them."""
+        count = 0
         
-        logger.info("Generating perceptual hashes...")
+        if interval:
+            logger.info(f"Hashing frames at {interval} frame intervals")
+        else:
+            logger.info("Hashing all frames")
+        logger.info(f"Using {self.algo} ({self.hash_bits}-bit) hashes{' on the GPU' if self.use_gpu else ''}")
         
-        for i, (frame_num, frame_path) in enumerate(frames):
-            try:
-                with Image.open(frame_path) as img:
-                    phash = str(imagehash.phash(img))
-                    hashes[frame_num] = phash
-                
-                if (i + 1) % 100 == 0:
-                    logger.info(f"Processed {i + 1}/{len(frames)} frames")
+        if self.use_gpu:
+            frame_hashes = self._hash_frames_gpu(interval)
+        elif self.workers > 1:
+            logger.info(f"Hashing with {self.workers} worker processes")
+            frame_hashes = self._hash_frames_pool(interval)
+        else:
+            frame_hashes = self._hash_frames_cpu(interval)
+        
+        for frame_num, frame_hash in frame_hashes:
+            yield frame_num, frame_hash
+            count += 1
             
-            except Exception as e:
-                logger.warning(f"Failed to process frame {frame_num}: {e}")
+            if count % 100 == 0:
+                logger.info(f"Hashed {count} frames...")
         
-        logger.info(f"Generated {len(hashes)} hashes")
-        return hashes
+        logger.info(f"Generated {count} hashes")
 
-    def find_duplicates(self, hashes: Dict[int, str]) -> List[int]:
-        """Find duplicate frames based on hash similarity."""
-        duplicates = []
-        processed_hashes = set()
-        hash_to_frame = {}
+    def find_unique_frames(self, frame_hashes: Iterable[Tuple[int, np.ndarray]]) -> Tuple[List[int], int]:
+        """Find frames that are not duplicates of an earlier kept frame.
+        
+        Consumes (frame_num, hash) pairs as they arrive, holding only the kept
+        hashes, and returns the kept frame numbers and the number of frames seen.
+        """
+        unique_frames = []
+        index = _BKTreeHashIndex() if self.index == 'bktree' else _LinearHashIndex(self.hash_bits)
+        total_frames = 0
         
         logger.info(f"Finding duplicates with threshold {self.similarity_threshold}...")
         
-        for frame_num, hash_str in hashes.items():
-            hash_obj = imagehash.hex_to_hash(hash_str)
-            is_duplicate = False
+        # The kept frame the last frame matched, and its hash as an int
+        scene_frame = None
+        scene_hash = None
+        temporal_hits = 0
+        
+        for frame_num, frame_hash in frame_hashes:
+            total_frames += 1
+            match = None
+            hash_value = _words_to_hash(frame_hash)
             
-            for processed_hash_str in processed_hashes:
-                processed_hash_obj = imagehash.hex_to_hash(processed_hash_str)
-                difference = hash_obj - processed_hash_obj
-                
+            # Duplicates are overwhelmingly consecutive, so try the current scene's frame first
+            if scene_hash is not None:
+                difference = _hamming(scene_hash, hash_value)
                 if difference <= self.similarity_threshold:
-                    duplicates.append(frame_num)
-                    is_duplicate = True
-                    logger.debug(f"Frame {frame_num} is duplicate of frame {hash_to_frame[processed_hash_str]} (diff: {difference})")
-                    break
+                    match = scene_frame, difference, scene_hash
+                    temporal_hits += 1
+            
+            if match is None:
+                match = index.find(frame_hash, self.similarity_threshold)
             
-            if not is_duplicate:
-                processed_hashes.add(hash_str)
-                hash_to_frame[hash_str] = frame_num
+            if match is not None:
+                scene_frame, difference, scene_hash = match
+                logger.debug(f"Frame {frame_num} is duplicate of frame {scene_frame} (diff: {difference})")
+                continue
+            
+            index.add(frame_num, frame_hash)
+            unique_frames.append(frame_num)
+            scene_frame, scene_hash = frame_num, hash_value
         
-        logger.info(f"Found {len(duplicates)} duplicate frames")
-        return duplicates
+        logger.debug(f"{temporal_hits} duplicates matched the previous scene without an index lookup")
+        logger.info(f"Found {total_frames - len(unique_frames)} duplicate frames")
+        return unique_frames, total_frames
 
-    def save_unique_frames(self, frames: List[Tuple[int, str]], duplicates: List[int], output_dir: str):
-        """Save unique frames to output directory."""
+    def save_unique_frames(self, unique_frames: Iterable[int], output_dir: str, interval: int = None):
+        """Decode the video again and write each unique frame once."""
         output_path = Path(output_dir)
         output_path.mkdir(parents=True, exist_ok=True)
         
-        duplicate_set = set(duplicates)
+        # Frames are decoded in ascending order, so unique frames are matched with a cursor
+        unique = sorted(unique_frames)
         saved_count = 0
         
         logger.info(f"Saving unique frames to {output_dir}...")
         
-        for frame_num, frame_path in frames:
-            if frame_num not in duplicate_set:
-                output_file = output_path / f"unique_frame_{frame_num:06d}.jpg"
-                shutil.copy2(frame_path, output_file)
-                saved_count += 1
+        if unique:
+            for frame_num, frame in self.extract_frames(interval):
+                if frame_num == unique[saved_count]:
+                    output_file = output_path / f"unique_frame_{frame_num:06d}.jpg"
+                    cv2.imwrite(str(output_file), frame)
+                    saved_count += 1
+                    
+                    # Nothing after the last unique frame needs decoding
+                    if saved_count == len(unique):
+                        break
         
         logger.info(f"Saved {saved_count} unique frames")
-        
-        # Cleanup temp files
-        temp_dir = Path(frames[0][1]).parent
-        shutil.rmtree(temp_dir)
 
     def deduplicate(self, interval: int = None, output_dir: str = "unique_frames"):
         """Main deduplication process."""
         logger.info(f"Starting deduplication of {self.video_path}")
         
-        # Extract frames
-        frames = self.extract_frames(interval)
-        
-        # Generate hashes
-        hashes = self.generate_hashes(frames)
+        total_frames, fps = self.video_info()
+        logger.info(f"Video info: {total_frames} frames, {fps:.2f} FPS")
         
-        # Find duplicates
-        duplicates = self.find_duplicates(hashes)
+        # Decode, hash and deduplicate frames in a single streamed pass
+        unique_frames, total_frames = self.find_unique_frames(self.iter_hashes(interval))
         
         # Save unique frames
-        self.save_unique_frames(frames, duplicates, output_dir)
+        self.save_unique_frames(unique_frames, output_dir, interval)
         
-        total_frames = len(frames)
-        unique_frames = total_frames - len(duplicates)
-        reduction_percent = (len(duplicates) / total_frames * 100) if total_frames > 0 else 0
+        duplicate_count = total_frames - len(unique_frames)
+        reduction_percent = (duplicate_count / total_frames * 100) if total_frames > 0 else 0
         
         logger.info(f"Deduplication complete!")
         logger.info(f"Original frames: {total_frames}")
-        logger.info(f"Duplicate frames: {len(duplicates)}")
-        logger.info(f"Unique frames: {unique_frames}")
+        logger.info(f"Duplicate frames: {duplicate_count}")
+        logger.info(f"Unique frames: {len(unique_frames)}")
         logger.info(f"Reduction: {reduction_percent:.1f}%")
 
 
@@ -184,6 +661,10 @@ Examples:
   python video_dedup.py video.mp4
   python video_dedup.py video.mp4 --interval 30 --threshold 3
   python video_dedup.py video.mp4 --output-dir ./frames --threshold 8
+  python video_dedup.py video.mp4 --algo pdq
+  python video_dedup.py video.mp4 --gpu
+  python video_dedup.py video.mp4 --algo pdq --workers 0
+  python video_dedup.py video.mp4 --index bktree
         """
     )
     
@@ -198,8 +679,15 @@ Examples:
     parser.add_argument(
         '--threshold', '-t',
         type=int,
-        default=5,
-        help='Similarity threshold for duplicate detection (0-64, lower = more strict). Default: 5'
+        help='Similarity threshold for duplicate detection (0-64 for phash, 0-256 for pdq, lower = more strict). '
+             'Default: 5 for phash, 31 for pdq'
+    )
+    
+    parser.add_argument(
+        '--algo', '-a',
+        choices=sorted(HASH_ALGORITHMS),
+        default='phash',
+        help='Perceptual hash algorithm: 64-bit phash or 256-bit PDQ (requires pdqhash). Default: phash'
     )
     
     parser.add_argument(
@@ -209,6 +697,27 @@ Examples:
         help='Output directory for unique frames. Default: unique_frames'
     )
     
+    parser.add_argument(
+        '--gpu',
+        action='store_true',
+        help='Decode and downscale frames on a CUDA GPU (phash only, requires OpenCV built with CUDA)'
+    )
+    
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        default=1,
+        help='Number of processes used to hash frames (0 = one per CPU core). Default: 1'
+    )
+    
+    parser.add_argument(
+        '--index',
+        choices=HASH_INDEXES,
+        default='linear',
+        help='Structure searched for earlier kept frames: linear scan or BK-tree (requires pybktree). '
+             'Default: linear'
+    )
+    
     parser.add_argument(
         '--verbose', '-v',
         action='store_true',
@@ -220,11 +729,19 @@ Examples:
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
     
-    if args.threshold < 0 or args.threshold > 64:
-        parser.error("Threshold must be between 0 and 64")
+    hash_bits = HASH_ALGORITHMS[args.algo][0]
+    if args.threshold is not None and (args.threshold < 0 or args.threshold > hash_bits):
+        parser.error(f"Threshold must be between 0 and {hash_bits} for {args.algo}")
+    
+    if args.gpu and args.algo != 'phash':
+        parser.error("--gpu is only supported with --algo phash")
+    
+    if args.workers < 0:
+        parser.error("Workers must be 0 or more")
     
     try:
-        deduplicator = VideoDeduplicator(args.video_path, args.threshold)
+        deduplicator = VideoDeduplicator(args.video_path, args.threshold, args.algo, args.gpu,
+                                         args.workers or os.cpu_count(), args.index)
         deduplicator.deduplicate(args.interval, args.output_dir)
         
     except Exception as e: